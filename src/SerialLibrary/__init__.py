@@ -2,67 +2,95 @@
 from __future__ import unicode_literals
 import codecs
 import re
-from collections import OrderedDict
+from functools import lru_cache
 from os import SEEK_CUR
-from sys import platform
+from time import monotonic
 
 from serial import Serial, SerialBase, serial_for_url
 from serial.rs485 import RS485Settings
 from serial.serialutil import LF
-from serial.tools.list_ports import comports, grep
 from serial.tools import hexlify_codec
 
 from robot.api import logger
 from robot.utils import asserts, is_truthy, is_string
 
+from .version import VERSION, VERSION_STRING
 
-__version__ = (0, 4, 0)
 
-if platform == 'win32':
-    import ntpath as ospath
-else:
-    import os.path as ospath
-abspath = ospath.abspath
-isabs = ospath.isabs
-join = ospath.join
+__version__ = VERSION
 
 
-# unicode type hack
-unicode_ = type('')
-
 # add hexlify to codecs
+def hexlify_encode_plus(data, errors='strict'):
+    # bytes.fromhex() parses in C and skips whitespace between byte pairs.
+    # Anything it rejects (e.g. single-digit tokens like '1 2') goes
+    # through pySerial's token-wise parser as before.
+    try:
+        return (bytes.fromhex(data), len(data))
+    except ValueError:
+        return hexlify_codec.hex_encode(data, errors)
+
+
 def hexlify_decode_plus(data, errors='strict'):
-    udata, length = hexlify_codec.hex_decode(data, errors)
-    return (udata.rstrip(), length)
+    # bytes.hex() formats the whole buffer in C, without trailing space
+    return (data.hex(' ').upper(), len(data))
 
 hexlify_codec_plus = codecs.CodecInfo(
     name='hexlify',
-    encode=hexlify_codec.hex_encode,
+    encode=hexlify_encode_plus,
     decode=hexlify_decode_plus,
     incrementalencoder=hexlify_codec.IncrementalEncoder,
     incrementaldecoder=hexlify_codec.IncrementalDecoder,
     streamwriter=hexlify_codec.StreamWriter,
     streamreader=hexlify_codec.StreamReader)
 
-codecs.register(lambda c: hexlify_codec_plus if c == 'hexlify' else None)
+def hexlify_search(name, codec_info=hexlify_codec_plus):
+    return codec_info if name == 'hexlify' else None
+
+codecs.register(hexlify_search)
 
 DEFAULT_SETTINGS = SerialBase(
     timeout=1.0, write_timeout=1.0, inter_byte_timeout=0.0).get_settings()
 
+# parameter types are fixed by SerialBase defaults, whatever values are set;
+# its keys are also the set of valid parameter names
+DEFAULT_TYPES = dict((k, type(v)) for k, v in DEFAULT_SETTINGS.items())
+
+# locators that cannot name a port
+INVALID_LOCATORS = frozenset((None, '', '_'))
+
+# bytes read from file and written to port at once by Write File Data
+FILE_CHUNK_SIZE = 4096
+
+# seconds to reuse com port list before enumerating ports again
+COM_PORTS_CACHE_TTL = 0.5
+
+# strings is_truthy_on_off() treats as off
+FALSY_STRINGS = frozenset(('FALSE', 'NO', '0', 'OFF', ''))
+
 
 def is_truthy_on_off(item):
     if is_string(item):
         item = item.strip()
         if item.isdigit():
             return bool(int(item))
-        return item.strip().upper() not in ['FALSE', 'NO', '0', 'OFF', '']
+        return item.upper() not in FALSY_STRINGS
     return bool(item)
 
 
+def truthy(value):
+    return value if isinstance(value, bool) else is_truthy(value)
+
+
 def to_on_off(value):
     return 'On' if bool(value) is True else 'Off'
 
 
+@lru_cache(maxsize=128)
+def _compile_i(pattern):
+    return re.compile(pattern, re.I)
+
+
 class SerialLibrary:
     """Robot Framework test library for manipulating serial ports
 
@@ -128,9 +156,11 @@ class SerialLibrary:
     """
 
     ROBOT_LIBRARY_SCOPE = 'GLOBAL'
-    ROBOT_LIBRARY_VERSION = __version__
+    ROBOT_LIBRARY_VERSION = VERSION_STRING
 
-    LOGGER_MAP = dict(INFO=logger.info, DEBUG=logger.debug, WARN=logger.warn)
+    LOGGER_MAP = dict(
+        INFO=logger.info, DEBUG=logger.debug, WARN=logger.warn,
+        info=logger.info, debug=logger.debug, warn=logger.warn)
 
     def __init__(self, port_locator=None, encoding='hexlify', **kwargs):
         """
@@ -158,10 +188,13 @@ class SerialLibrary:
 
         """
         self._encoding = encoding
-        self._ports = OrderedDict()
-        self._defaults = dict(DEFAULT_SETTINGS)
+        self._ports = {}
+        self._defaults = DEFAULT_SETTINGS.copy()
         self.set_default_parameters(kwargs)
         self._current_port_locator = None
+        self._current_port = None
+        self._com_ports = None
+        self._com_ports_time = 0.0
         if port_locator is not None:
             self.add_port(port_locator)
             self._current_port_str = port_locator
@@ -174,6 +207,14 @@ class SerialLibrary:
         """
         encoding_mode = encoding_mode or 'strict'
         encoding = encoding or self._encoding or 'hexlify'
+        if encoding == 'hexlify':
+            # default codec is called directly, skipping codec registry
+            try:
+                return hexlify_codec_plus.encode(ustring, encoding_mode)[0]
+            except ValueError as exc:
+                raise ValueError(
+                    "encoding with 'hexlify' codec failed (%s: %s)"
+                    % (type(exc).__name__, exc)) from exc
         return ustring.encode(encoding, encoding_mode)
 
     def _decode(self, bstring, encoding=None, encoding_mode=None):
@@ -182,6 +223,8 @@ class SerialLibrary:
         """
         encoding_mode = encoding_mode or 'replace'
         encoding = encoding or self._encoding or 'hexlify'
+        if encoding == 'hexlify':
+            return hexlify_codec_plus.decode(bstring, encoding_mode)[0]
         return bstring.decode(encoding, encoding_mode)
 
     def _port(self, port_locator=None, fail=True):
@@ -193,13 +236,21 @@ class SerialLibrary:
         If specified port is not found, exception is raised
         when fail is True, otherwise None is returned silently.
         """
-        if port_locator in [None, '_']:
-            port_locator = self._current_port_locator
-        port = self._ports.get(port_locator, None)
-        if port is None and is_truthy(fail) is True:
+        if port_locator is None or port_locator == '_':
+            port = self._current_port
+        else:
+            port = self._ports.get(port_locator)
+        if port is None and fail:
             asserts.fail('No such port.')
         return port
 
+    def _set_current_port(self, port_locator):
+        """
+        Make port with given locator current, keeping reference to the port.
+        """
+        self._current_port_locator = port_locator
+        self._current_port = self._ports.get(port_locator)
+
     def get_encoding(self):
         """
         Returns default encoding for the library instance.
@@ -229,8 +280,34 @@ class SerialLibrary:
 
             @{ports} =   List Com Ports
             Log  ${ports[0].device}
+
+        Enumerating ports may be slow on some platforms, so the result
+        is reused for 0.5 seconds by com port keywords. Use Invalidate
+        Com Port Cache to enumerate ports again immediately.
+        """
+        return list(self._list_com_ports())
+
+    def _list_com_ports(self):
+        """
+        Returns (cached) list of ListPortInfo instances.
         """
-        return comports()
+        now = monotonic()
+        if self._com_ports is None or now - self._com_ports_time > COM_PORTS_CACHE_TTL:
+            # imported here, platform specific enumeration backend
+            # is not needed unless com ports are listed
+            from serial.tools.list_ports import comports
+            self._com_ports = list(comports())
+            self._com_ports_time = now
+        return self._com_ports
+
+    def invalidate_com_port_cache(self):
+        """
+        Discards cached com port list.
+
+        Next com port keyword will enumerate ports on the system again.
+        Useful right after a device is plugged in or removed.
+        """
+        self._com_ports = None
 
     def list_com_port_names(self):
         """
@@ -238,18 +315,23 @@ class SerialLibrary:
 
         Items are sorted in dictionary order.
         """
-        return sorted(port_info.device for port_info in self.list_com_ports())
+        return sorted(port_info.device for port_info in self._list_com_ports())
 
     def com_port_should_exist_regexp(self, regexp):
         """
         Fails if com port matching given pattern is not found on the system.
 
-        This keyword uses serial.tools.list_ports.grep internally thus
-        port name, description and hardware ID are searched.
+        Port name, description and hardware ID are searched, same as
+        serial.tools.list_ports.grep. Matching is case-insensitive.
 
         Returns list of com ports matching the pattern, if exists.
         """
-        found = list(grep(regexp))
+        regexp = _compile_i(regexp)
+        found = [
+            port_info for port_info in self._list_com_ports()
+            if regexp.search(port_info.device)
+            or regexp.search(port_info.description)
+            or regexp.search(port_info.hwid)]
         asserts.assert_true(len(found) > 0, 'Matching port does not exist.')
         return found
 
@@ -263,11 +345,10 @@ class SerialLibrary:
         Values can be in any types and are converted into
         appropreate type.
         """
-        prev_value = OrderedDict(self._defaults)
+        prev_value = self._defaults.copy()
         for key, value in params.items():
-            if key in self._defaults:
-                value_type = type(self._defaults.get(key))
-                self._defaults[key] = value_type(value)
+            if key in DEFAULT_TYPES:
+                self._defaults[key] = DEFAULT_TYPES[key](value)
         return prev_value
 
     def reset_default_parameters(self):
@@ -277,7 +358,7 @@ class SerialLibrary:
         This keyword does not directly affect those exisitng ports added
         so far.
         """
-        self._defaults = dict(DEFAULT_SETTINGS)
+        self._defaults = DEFAULT_SETTINGS.copy()
 
     def get_current_port_locator(self):
         """
@@ -304,7 +385,7 @@ class SerialLibrary:
         current_port_locator = self._current_port_locator
         if current_port_locator is None:
             current_port_locator = ''
-        regexp = re.compile(port_locator_regexp, re.I)
+        regexp = _compile_i(port_locator_regexp)
         asserts.assert_not_none(
             regexp.match(current_port_locator),
             'Port does not match.', values=False)
@@ -326,13 +407,18 @@ class SerialLibrary:
 
         Returns created port instance.
         """
-        if port_locator in [None, '', '_']:
+        if port_locator in INVALID_LOCATORS:
             asserts.fail('Invalid port locator.')
         elif port_locator in self._ports:
             asserts.fail('Port already exists.')
-        serial_kw = dict(
-            (k, type(v)(kwargs.get(k, v)))
-            for k, v in self._defaults.items())
+        # defaults are already converted by set_default_parameters,
+        # only overridden values need type conversion
+        if kwargs:
+            serial_kw = dict(
+                (k, DEFAULT_TYPES[k](kwargs[k]) if k in kwargs else v)
+                for k, v in self._defaults.items())
+        else:
+            serial_kw = self._defaults.copy()
         # try url first, then port name
         try:
             port = serial_for_url(port_locator, **serial_kw)
@@ -340,10 +426,10 @@ class SerialLibrary:
             port = Serial(port_locator, **serial_kw)
         asserts.assert_not_none(port, 'Port initialization failed.')
         self._ports[port_locator] = port
-        if port.is_open and (is_truthy(open) is False):
+        if port.is_open and not truthy(open):
             port.close()
-        if self._current_port_locator is None or make_current:
-            self._current_port_locator = port_locator
+        if self._current_port_locator is None or truthy(make_current):
+            self._set_current_port(port_locator)
         return port
 
     def delete_port(self, port_locator=None):
@@ -368,10 +454,8 @@ class SerialLibrary:
         # if the deleted port is current port, most recent port
         # left in the instacne will be current port
         if port_locator == self._current_port_locator:
-            self._current_port_locator = None
-            if self._ports.keys():
-                self._current_port_locator = list(self._ports.keys())[-1]
-        del port
+            self._set_current_port(
+                next(reversed(self._ports)) if self._ports else None)
 
     def delete_all_ports(self):
         """
@@ -379,12 +463,11 @@ class SerialLibrary:
 
         Opened ports are closed before deletion.
         """
-        self._current_port_locator = None
+        self._set_current_port(None)
         while self._ports:
             locator, port = self._ports.popitem()
             if port.is_open:
                 port.close()
-                del port
 
     def open_port(self, port_locator=None):
         """
@@ -438,7 +521,7 @@ class SerialLibrary:
         """
         if port_locator not in self._ports:
             asserts.fail('No such port.')
-        self._current_port_locator = port_locator
+        self._set_current_port(port_locator)
 
     def get_port_parameter(self, param_name, port_locator=None):
         """
@@ -452,7 +535,7 @@ class SerialLibrary:
 
         Fails on wrong param_name or port_locator.
         """
-        if param_name not in self._defaults:
+        if param_name not in DEFAULT_TYPES:
             asserts.fail('Wrong parameter name.')
         port = self._port(port_locator)
         return getattr(port, param_name)
@@ -468,11 +551,11 @@ class SerialLibrary:
         Fails on wrong param_name or port_locator.
         Returns previous value.
         """
-        if param_name not in self._defaults:
+        param_type = DEFAULT_TYPES.get(param_name)
+        if param_type is None:
             asserts.fail('Wrong parameter name.')
         port = self._port(port_locator, fail=True)
         prev_value = getattr(port, param_name)
-        param_type = type(self._defaults.get(param_name))
         setattr(port, param_name, param_type(value))
         return prev_value
 
@@ -494,8 +577,9 @@ class SerialLibrary:
         Any other level causes error.
         If `encoding` is not given, default encoding is used.
         """
-        loglevel = loglevel.upper()
         logger_func = self.LOGGER_MAP.get(loglevel, None)
+        if logger_func is None:
+            logger_func = self.LOGGER_MAP.get(loglevel.upper(), None)
         if logger_func is None:
             raise asserts.fail('Invalid loglevel.')
         logger_func(self.read_all_data(encoding, port_locator))
@@ -508,11 +592,11 @@ class SerialLibrary:
         This keyword compares values in byte space; data is encoded to bytes
         then compared to bytes read from the port.
         """
-        bdata = self._encode(data, encoding=encoding)
+        bdata = data if isinstance(data, bytes) else self._encode(data, encoding=encoding)
         bread = self._port(port_locator).read_all()
         if bread != bdata:
-            hex_bread = self._decode(bread, encoding='hexlify')
-            hex_bdata = self._decode(bdata, encoding='hexlify')
+            hex_bread = bread.hex(' ').upper()
+            hex_bdata = bdata.hex(' ').upper()
             msg = "'%s'(read) != '%s'(data)" % (hex_bread, hex_bdata)
             asserts.fail(msg)
 
@@ -579,9 +663,7 @@ class SerialLibrary:
         until the requested number of bytes is read.
         Returns (encoded) read data.
         """
-        if is_string(size):
-            size = int(size)
-        buf = self._port(port_locator).read(size)
+        buf = self._port(port_locator).read(int(size))
         return self._decode(buf, encoding=encoding, encoding_mode=encoding_mode)
 
     def write_data(self, data, encoding=None, encoding_mode=None, port_locator=None):
@@ -590,13 +672,49 @@ class SerialLibrary:
 
         If data is a Python's byte string object, it will be written
         to the port intact. If data is unicode string, it will be
-        encoded with given encoding before writing. Otherwise,
-        data is converted to unicode and processed same as unicode string.
+        encoded with given encoding before writing. Numbers are
+        converted to unicode and processed same as unicode string.
+        Other objects (e.g. bytearray or list of integers) are passed
+        to pySerial as they are.
         """
-        if isinstance(data, str):
-            data = self._encode(data, encoding=encoding, encoding_mode=encoding_mode)
+        data = self._prepare_data(data, encoding, encoding_mode)
         self._port(port_locator).write(data)
 
+    def write_data_chunks(self, chunks, encoding=None, encoding_mode=None, port_locator=None):
+        """
+        Writes list of data into the port at once.
+
+        Each item of `chunks` is processed same as Write Data keyword,
+        then all items are concatenated and written to the port with
+        single write, e.g.::
+
+            @{chunks} =    Create List    01 23    45    67 89
+            Write Data Chunks    ${chunks}
+
+        Fails if `chunks` is a single string or byte string; use Write Data
+        for those.
+        """
+        if isinstance(chunks, (str, bytes, bytearray)):
+            asserts.fail('Chunks should be a list.')
+        buf = bytearray()
+        for data in chunks:
+            buf.extend(self._prepare_data(data, encoding, encoding_mode))
+        self._port(port_locator).write(buf)
+
+    def _prepare_data(self, data, encoding=None, encoding_mode=None):
+        """
+        Convert data given to write keywords into bytes-like object.
+        """
+        data_type = type(data)
+        if data_type is bytes:
+            return data
+        if data_type is not str:
+            if isinstance(data, (int, float)):
+                data = str(data)
+            elif not isinstance(data, str):
+                return data
+        return self._encode(data, encoding=encoding, encoding_mode=encoding_mode)
+
     def flush_port(self, port_locator=None):
         """
         Flush port so that all waiting data is processed.
@@ -633,15 +751,13 @@ class SerialLibrary:
         """
         Sets RTS (Request To Send) status.
         """
-        self._port(port_locator).rts = is_truthy_on_off(value)
-        value = 1 if is_truthy_on_off(value) else 0
-        self._port(port_locator).rts = value
+        self._port(port_locator).rts = 1 if is_truthy_on_off(value) else 0
 
     def set_dtr(self, value, port_locator=None):
         """
         Sets DTR (Data Terminal Ready) status.
         """
-        self._port(port_locator).dtr = is_truthy_on_off(value)
+        self._port(port_locator).dtr = 1 if is_truthy_on_off(value) else 0
 
     def _attr_should_be(self, attr, value, port_locator):
         """
@@ -764,12 +880,30 @@ class SerialLibrary:
         support seek(n, SEEK_CUR).
         If length is negative, all content after current input file position is read.
         Otherwise, number of specified bytes are read from the input file.
+        Content is read and written in chunks, so large files (e.g. firmware
+        images) are not loaded into memory at once.
 
         Fails if specified file could not be opened.
         """
-        stream = open(file_or_path, 'rb') if is_string(file_or_path) else file_or_path
+        port = self._port(port_locator)
         offset, length = int(offset), int(length)
+        if is_string(file_or_path):
+            with open(file_or_path, 'rb') as stream:
+                self._write_stream(port, stream, offset, length)
+        else:
+            self._write_stream(port, file_or_path, offset, length)
+
+    def _write_stream(self, port, stream, offset, length):
+        """
+        Copy stream content to port, FILE_CHUNK_SIZE bytes at a time.
+        """
         if offset > 0:
             stream.seek(offset, SEEK_CUR)
-        read_bytes = stream.read(length) if length >= 0 else stream.read()
-        self._port(port_locator).write(read_bytes)
+        while length != 0:
+            chunk_size = FILE_CHUNK_SIZE if length < 0 else min(length, FILE_CHUNK_SIZE)
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            port.write(chunk)
+            if length > 0:
+                length -= len(chunk)
@@ -1,4 +1,5 @@
 VERSION = (0, 4, 0)
+VERSION_STRING = '.'.join(map(str, VERSION))
 
 def get_version():
     return VERSION;